@@ -1,11 +1,23 @@
 import discord
 from discord import app_commands
+import aiofiles
+import argparse
 import asyncio
+import hashlib
+import io
+import json
 import os
+import resource
 import shlex
-import subprocess
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import time
 import uuid
 import traceback
+from collections import OrderedDict, deque
 
 # Bot token
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -16,64 +28,465 @@ intents.message_content = True
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
-# Temp folder
+# Temp folder (wiped on startup, each eval gets its own subdirectory)
 TEMP_DIR = "temp_files"
+shutil.rmtree(TEMP_DIR, ignore_errors=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# Supported languages
+# Compiled binaries, keyed by a hash of language, flags and sources
+BIN_CACHE = "bin_cache"
+BIN_CACHE_MAX_BYTES = 512 * 1024 * 1024
+os.makedirs(BIN_CACHE, exist_ok=True)
+# key -> [lock, number of evals holding or waiting on it]
+COMPILE_LOCKS = {}
+
+# Recent run results, keyed like the binary cache. The TTL is kept short so
+# programs using randomness or the clock still feel live.
+OUT_CACHE = OrderedDict()
+OUT_CACHE_TTL = 10
+OUT_CACHE_MAX = 256
+
+# Supported languages. Compiled languages default to fast, unoptimized
+# builds; user flags come later so they can override the defaults.
 LANGUAGES = {
     "c": {
-        "compile": "gcc {sources} -o {output} {flags}",
-        "run": "./{output}",
+        "compile": lambda sources, output, flags: [
+            "gcc", "-O0", "-pipe", "-w", *sources, "-o", output, *shlex.split(flags)
+        ],
+        "run": lambda output, sources: [os.path.abspath(output)],
         "extension": ".c",
     },
     "python": {
-        "run": "python3 {sources}",
+        "run": lambda output, sources: ["python3", *sources],
         "extension": ".py",
     },
     "rust": {
-        "compile": "rustc {sources} -o {output} {flags}",
-        "run": "./{output}",
+        "compile": lambda sources, output, flags: [
+            "rustc", "-C", "opt-level=0", "-C", "debuginfo=0", "-C", "codegen-units=16",
+            *sources, "-o", output, *shlex.split(flags),
+        ],
+        "run": lambda output, sources: [os.path.abspath(output)],
         "extension": ".rs",
     },
     "go": {
-        "compile": "go build -o {output} {sources} {flags}",
-        "run": "./{output}",
+        "compile": lambda sources, output, flags: [
+            "go", "build", "-gcflags=-N -l", "-o", output, *shlex.split(flags), *sources
+        ],
+        "run": lambda output, sources: [os.path.abspath(output)],
         "extension": ".go",
     },
     "bash": {
-        "run": "bash {sources}",
+        "run": lambda output, sources: ["bash", *sources],
         "extension": ".sh",
     },
-     "cpp": {
-        "compile": "g++ {sources} -o {output} {flags}",
-        "run": "./{output}",
+    "cpp": {
+        "compile": lambda sources, output, flags: [
+            "g++", "-O0", "-pipe", "-w", *sources, "-o", output, *shlex.split(flags)
+        ],
+        "run": lambda output, sources: [os.path.abspath(output)],
         "extension": ".cpp",
     },
     "php": {
-        "run": "php {sources}",
+        "run": lambda output, sources: ["php", *sources],
         "extension": ".php",
     },
     "lua": {
-        "run": "lua {sources}",
+        "run": lambda output, sources: ["lua", *sources],
         "extension": ".lua",
     },
     "ruby": {
-        "run": "ruby {sources}",
+        "run": lambda output, sources: ["ruby", *sources],
         "extension": ".rb",
     },
     "javascript": {
-        "run": "node {sources}",
+        "run": lambda output, sources: ["node", *sources],
         "extension": ".js",
     },
 }
 
+# Extension -> language, for auto-detection
+EXT_TO_LANG = {info["extension"]: lang for lang, info in LANGUAGES.items()}
+
+# /eval flag grammar (see /help); unknown tokens such as file names are ignored
+ARG_PARSER = argparse.ArgumentParser(add_help=False, allow_abbrev=False, exit_on_error=False)
+ARG_PARSER.add_argument("-l", dest="language")
+ARG_PARSER.add_argument("-c", dest="code")
+ARG_PARSER.add_argument("-ln", dest="linked_files", nargs="+", default=[])
+ARG_PARSER.add_argument("-f", dest="flags", default="")
+ARG_PARSER.add_argument("-r", action="store_true")
+ARG_PARSER.add_argument("-fl", action="store_true")
+
+# Flags whose value is always the next token, even if it starts with "-"
+VALUE_FLAGS = {"-l", "-c", "-f"}
+
+def parse_eval_args(args: list):
+    """Parse /eval args, binding each value flag to its next token (e.g. -f -O2)."""
+    joined = []
+    tokens = iter(args)
+    for arg in tokens:
+        value = next(tokens, None) if arg in VALUE_FLAGS else None
+        joined.append(arg if value is None else f"{arg}={value}")
+    return ARG_PARSER.parse_known_args(joined)
+
+# Upload limits, checked before anything is written to disk
+MAX_SOURCE_BYTES = 1 * 1024 * 1024
+MAX_TOTAL_SOURCE_BYTES = 4 * 1024 * 1024
+
 MAX_LOGS = 10
-RUN_LOGS = []
+RUN_LOGS = deque(maxlen=MAX_LOGS)
 
-@tree.command(name="help", description="Show help info for the bot")
-async def help_command(interaction: discord.Interaction):
-    help_text = """
+# Wall-clock limit for each compile/run step (seconds)
+EXEC_TIMEOUT = 10
+
+# Resource limits applied to user programs (not the compilers). Memory is
+# capped with RLIMIT_DATA rather than RLIMIT_AS: Go and Node reserve large
+# address ranges at startup and abort under an address-space limit.
+CHILD_LIMITS = {
+    resource.RLIMIT_CPU: 5,
+    resource.RLIMIT_DATA: 512 * 1024 * 1024,
+    resource.RLIMIT_NPROC: 64,
+    resource.RLIMIT_FSIZE: 10 * 1024 * 1024,
+}
+
+# prlimit(1) options for each limit. Limits are applied by exec'ing through
+# prlimit rather than preexec_fn, which is unsafe once the bot has threads.
+PRLIMIT_OPTIONS = {
+    resource.RLIMIT_CPU: "--cpu",
+    resource.RLIMIT_DATA: "--data",
+    resource.RLIMIT_NPROC: "--nproc",
+    resource.RLIMIT_FSIZE: "--fsize",
+}
+
+def with_limits(limits: dict, argv: list) -> list:
+    """Prefix argv with prlimit, never raising above an existing hard limit."""
+    options = []
+    for res, value in limits.items():
+        hard = resource.getrlimit(res)[1]
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        options.append(f"{PRLIMIT_OPTIONS[res]}={value}:{value}")
+    return ["prlimit", *options, "--", *argv]
+
+# Output capture: keep the first OUTPUT_HEAD_BYTES and the last
+# OUTPUT_TAIL_CHUNKS * READ_CHUNK bytes of each stream, and kill the
+# child once it has written more than MAX_OUTPUT_BYTES in total
+READ_CHUNK = 4096
+OUTPUT_HEAD_BYTES = 64 * 1024
+OUTPUT_TAIL_CHUNKS = 16
+MAX_OUTPUT_BYTES = 1024 * 1024
+
+async def read_capped(stream, kill, state: dict) -> bytes:
+    """Read a child stream into a head buffer plus a sliding tail."""
+    head = bytearray()
+    tail = deque(maxlen=OUTPUT_TAIL_CHUNKS)
+    skipped = False
+    while chunk := await stream.read(READ_CHUNK):
+        state["total"] += len(chunk)
+        if state["total"] > MAX_OUTPUT_BYTES and not state["killed"]:
+            state["killed"] = True
+            kill()
+        room = OUTPUT_HEAD_BYTES - len(head)
+        if room > 0:
+            head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            if len(tail) == tail.maxlen:
+                skipped = True
+            tail.append(chunk)
+    if skipped:
+        head += b"\n[...]\n"
+    head += b"".join(tail)
+    return bytes(head)
+
+async def run_process(argv: list, limits: dict = None, env: dict = None, cwd: str = None):
+    """Run argv without blocking the event loop, returning (returncode, stdout, stderr)."""
+    if limits:
+        argv = with_limits(limits, argv)
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        cwd=cwd,
+        start_new_session=True,
+    )
+
+    # Kill the whole session so background children can't hold the pipes open
+    def kill():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    state = {"total": 0, "killed": False}
+    try:
+        stdout, stderr, _ = await asyncio.wait_for(
+            asyncio.gather(
+                read_capped(proc.stdout, kill, state),
+                read_capped(proc.stderr, kill, state),
+                proc.wait(),
+            ),
+            timeout=EXEC_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        kill()
+        await proc.wait()
+        raise
+    if state["killed"]:
+        stderr += f"\n[output exceeded {MAX_OUTPUT_BYTES} bytes, process killed]".encode()
+    return proc.returncode, stdout, stderr
+
+# Warm interpreter that forks a fresh child per job. Jobs arrive on the
+# socket as JSON (argv and [resource, limit] pairs) plus the stdout/stderr
+# pipe fds; the worker replies with the child's pid and, once it exits,
+# its exit code.
+PY_ZYGOTE = r"""
+import json, os, resource, runpy, socket, struct, sys, traceback
+sock = socket.socket(fileno=int(sys.argv[1]))
+while True:
+    msg, fds, _, _ = socket.recv_fds(sock, 65536, 2)
+    if not msg:
+        sys.exit()
+    pid = os.fork()
+    if pid == 0:
+        break
+    for fd in fds:
+        os.close(fd)
+    sock.sendall(struct.pack("!i", pid))
+    _, status = os.waitpid(pid, 0)
+    sock.sendall(struct.pack("!i", os.waitstatus_to_exitcode(status)))
+
+# Only the forked child gets here. It runs the job as "python3 file.py" would
+# and then leaves through normal interpreter shutdown, so non-daemon threads
+# are joined and atexit handlers run.
+sock.close()
+os.setsid()
+job = json.loads(msg)
+for res, value in job["limits"]:
+    hard = resource.getrlimit(res)[1]
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(res, (value, value))
+os.dup2(fds[0], 1)
+os.dup2(fds[1], 2)
+for fd in fds:
+    os.close(fd)
+if job["cwd"]:
+    os.chdir(job["cwd"])
+path = job["argv"][0]
+sys.argv = job["argv"]
+sys.path[0] = os.path.dirname(os.path.abspath(path))
+try:
+    runpy.run_path(path, run_name="__main__")
+except SystemExit:
+    raise
+except BaseException as e:
+    # Drop the worker and runpy frames from the traceback
+    tb = e.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != path:
+        tb = tb.tb_next
+    traceback.print_exception(type(e), e, tb)
+    sys.exit(1)
+"""
+
+async def sock_recv_exact(sock: socket.socket, n: int) -> bytes:
+    loop = asyncio.get_running_loop()
+    data = b""
+    while len(data) < n:
+        chunk = await loop.sock_recv(sock, n - len(data))
+        if not chunk:
+            raise ConnectionError("worker exited")
+        data += chunk
+    return data
+
+async def open_pipe_reader(fd: int) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+    )
+    return reader
+
+class WorkerPool:
+    """Pre-spawned interpreters for one language, handed out via a queue.
+
+    Each worker runs one job at a time. When all of them are busy an extra
+    worker is spawned, and at most `size` are kept idle afterwards.
+    """
+
+    def __init__(self, driver: list, size: int):
+        self.driver = driver
+        self.size = size
+        self.idle = asyncio.Queue()
+        self.started = False
+
+    async def start(self):
+        if self.started:
+            return
+        self.started = True
+        for _ in range(self.size):
+            self.idle.put_nowait(await self.spawn())
+
+    async def spawn(self):
+        parent_sock, child_sock = socket.socketpair()
+        proc = await asyncio.create_subprocess_exec(
+            *self.driver, str(child_sock.fileno()),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            pass_fds=(child_sock.fileno(),),
+        )
+        child_sock.close()
+        parent_sock.setblocking(False)
+        return proc, parent_sock
+
+    async def retire(self, worker):
+        proc, sock = worker
+        sock.close()
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+    async def run(self, argv: list, limits: dict = None, cwd: str = None):
+        """Run a job on an idle worker, returning (returncode, stdout, stderr)."""
+        try:
+            worker = self.idle.get_nowait()
+        except asyncio.QueueEmpty:
+            worker = await self.spawn()
+        try:
+            result = await self.run_on(worker, argv, limits or {}, cwd)
+        except asyncio.TimeoutError:
+            # The job's child was killed and reaped; the worker is still healthy
+            await self.release(worker)
+            raise
+        except BaseException:
+            await self.retire(worker)
+            if self.idle.qsize() < self.size:
+                self.idle.put_nowait(await self.spawn())
+            raise
+        await self.release(worker)
+        return result
+
+    async def release(self, worker):
+        if self.idle.qsize() < self.size:
+            self.idle.put_nowait(worker)
+        else:
+            await self.retire(worker)
+
+    async def run_on(self, worker, argv: list, limits: dict, cwd: str):
+        _, sock = worker
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        try:
+            job = {"argv": argv, "limits": list(limits.items()), "cwd": cwd}
+            socket.send_fds(sock, [json.dumps(job).encode()], [out_w, err_w])
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        stdout_reader = await open_pipe_reader(out_r)
+        stderr_reader = await open_pipe_reader(err_r)
+        (pid,) = struct.unpack("!i", await sock_recv_exact(sock, 4))
+
+        def kill():
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        async def wait():
+            (code,) = struct.unpack("!i", await sock_recv_exact(sock, 4))
+            return code
+
+        state = {"total": 0, "killed": False}
+        wait_task = asyncio.ensure_future(wait())
+        try:
+            stdout, stderr, returncode = await asyncio.wait_for(
+                asyncio.gather(
+                    read_capped(stdout_reader, kill, state),
+                    read_capped(stderr_reader, kill, state),
+                    asyncio.shield(wait_task),
+                ),
+                timeout=EXEC_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            kill()
+            await wait_task
+            raise
+        if state["killed"]:
+            stderr += f"\n[output exceeded {MAX_OUTPUT_BYTES} bytes, process killed]".encode()
+        return returncode, stdout, stderr
+
+# Languages served by warm workers instead of a fresh interpreter per run
+WARM_POOLS = {
+    "python": WorkerPool(["python3", "-c", PY_ZYGOTE], size=2),
+}
+
+def sources_digest(language: str, flags: str, source_paths: list) -> str:
+    """Hash everything that affects how a set of sources builds and runs."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(language.encode() + b"\0" + flags.encode() + b"\0")
+    for path in source_paths:
+        h.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def cached_output(key: str):
+    """Return (returncode, stdout, stderr) for a fresh cache entry, or None."""
+    entry = OUT_CACHE.get(key)
+    if entry is None:
+        return None
+    *result, stored_at = entry
+    if time.monotonic() - stored_at >= OUT_CACHE_TTL:
+        del OUT_CACHE[key]
+        return None
+    OUT_CACHE.move_to_end(key)
+    return tuple(result)
+
+def store_output(key: str, returncode: int, stdout: bytes, stderr: bytes):
+    OUT_CACHE[key] = (returncode, stdout, stderr, time.monotonic())
+    OUT_CACHE.move_to_end(key)
+    while len(OUT_CACHE) > OUT_CACHE_MAX:
+        OUT_CACHE.popitem(last=False)
+
+# Signals used to enforce CHILD_LIMITS and the output cap
+LIMIT_SIGNALS = {signal.SIGKILL, signal.SIGXCPU, signal.SIGXFSZ}
+
+def signal_note(signum: int) -> str:
+    if signum in LIMIT_SIGNALS:
+        reason = "resource limit"
+    else:
+        try:
+            reason = signal.Signals(signum).name
+        except ValueError:
+            reason = "unknown signal"
+    return f"Killed by signal {signum} ({reason})"
+
+def evict_binary_cache(keep: str):
+    """Drop least recently used binaries until the cache fits its size cap."""
+    entries = []
+    total = 0
+    for name in os.listdir(BIN_CACHE):
+        path = os.path.join(BIN_CACHE, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_atime, st.st_size, path))
+        total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= BIN_CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+HELP_TEXT = """
 **Supported Commands:**
 
 `/help` - Show this help message
@@ -89,155 +502,187 @@ async def help_command(interaction: discord.Interaction):
 - `/eval -r -l python -c "print('hello')"`
 - `/eval -r -fl` (upload files after command)
 """
-    await interaction.response.send_message(help_text, ephemeral=True)
+
+@tree.command(name="help", description="Show help info for the bot")
+async def help_command(interaction: discord.Interaction):
+    await interaction.response.send_message(HELP_TEXT, ephemeral=True)
 
 @tree.command(name="logs", description="Show last N eval runs")
 async def logs_command(interaction: discord.Interaction):
-    text = "**Last Runs:**\n" + "\n".join(
-        f"`{log}`" for log in reversed(RUN_LOGS[-MAX_LOGS:])
-    ) if RUN_LOGS else "No runs yet."
+    if RUN_LOGS:
+        text = "**Last Runs:**\n" + "\n".join(f"`{log}`" for log in reversed(RUN_LOGS))
+    else:
+        text = "No runs yet."
     await interaction.response.send_message(text[:1900], ephemeral=True)
 
-async def process_eval(interaction: discord.Interaction, args: list, attachments: list):
-    language = None
-    code = None
-    linked_files = []
-    compiler_flags = ""
+async def save_attachment(attachment: discord.Attachment, work_dir: str) -> str:
+    path = os.path.join(work_dir, attachment.filename)
+    await attachment.save(path)
+    return path
 
+async def process_eval(interaction: discord.Interaction, args: list, attachments: list):
     # Parse arguments
-    i = 0
-    while i < len(args):
-        if args[i] == "-l":
-            language = args[i + 1].lower()
-            i += 2
-        elif args[i] == "-c":
-            code = args[i + 1]
-            i += 2
-        elif args[i] == "-ln":
-            i += 1
-            while i < len(args) and not args[i].startswith("-"):
-                linked_files.append(args[i])
-                i += 1
-        elif args[i] == "-f":
-            compiler_flags = args[i + 1]
-            i += 2
-        else:
-            i += 1
+    try:
+        ns, _ = parse_eval_args(args)
+    except argparse.ArgumentError as e:
+        await interaction.followup.send(f"Invalid arguments: {e}")
+        return
 
-    sources = ""
-    output_name = f"{TEMP_DIR}/{uuid.uuid4().hex}"
+    language = ns.language.lower() if ns.language else None
+    code = ns.code
+    linked_set = set(ns.linked_files)
+    compiler_flags = ns.flags
 
-    try:
-        # Handle inline code
-        if code:
-            if not language:
-                await interaction.followup.send("Error: Language (-l) required with -c")
+    # Absolute, since compile and run steps use it as their working directory
+    temp_root = os.path.abspath(TEMP_DIR)
+    with tempfile.TemporaryDirectory(prefix="eval_", dir=temp_root, ignore_cleanup_errors=True) as work_dir:
+        sources = []
+        total_bytes = 0
+
+        try:
+            # Handle inline code
+            if code:
+                if not language:
+                    await interaction.followup.send("Error: Language (-l) required with -c")
+                    return
+                if language not in LANGUAGES:
+                    await interaction.followup.send(f"Unsupported language: {language}")
+                    return
+
+                code_bytes = code.encode()
+                if len(code_bytes) > MAX_SOURCE_BYTES:
+                    await interaction.followup.send(f"Inline code too large ({len(code_bytes)} bytes)")
+                    return
+                total_bytes += len(code_bytes)
+
+                ext = LANGUAGES[language]["extension"]
+                # Fixed name so identical snippets hash the same (see sources_digest)
+                source_file = os.path.join(work_dir, f"main{ext}")
+                async with aiofiles.open(source_file, "wb") as f:
+                    await f.write(code_bytes)
+                sources.append(source_file)
+
+            # Handle attachments
+            to_save = [a for a in attachments if not linked_set or a.filename in linked_set]
+            seen_names = set()
+            for attachment in to_save:
+                if attachment.filename in seen_names:
+                    await interaction.followup.send(f"Duplicate attachment name: {attachment.filename}")
+                    return
+                seen_names.add(attachment.filename)
+                if os.path.join(work_dir, attachment.filename) in sources:
+                    await interaction.followup.send(f"{attachment.filename} clashes with the inline code file")
+                    return
+                if attachment.size > MAX_SOURCE_BYTES:
+                    await interaction.followup.send(f"{attachment.filename} too large ({attachment.size} bytes)")
+                    return
+                total_bytes += attachment.size
+            if total_bytes > MAX_TOTAL_SOURCE_BYTES:
+                await interaction.followup.send(f"Sources too large ({total_bytes} bytes total)")
                 return
+            paths = await asyncio.gather(*[save_attachment(a, work_dir) for a in to_save])
+            sources.extend(paths)
+            used_attachments = [a.filename for a in to_save]
+
+            # Auto-detect language from first file if not specified
+            if not language and used_attachments:
+                ext = os.path.splitext(used_attachments[0])[1]
+                language = EXT_TO_LANG.get(ext)
+                if language is None:
+                    await interaction.followup.send("Could not auto-detect language")
+                    return
+
+            # Validate language
             if language not in LANGUAGES:
                 await interaction.followup.send(f"Unsupported language: {language}")
                 return
 
-            ext = LANGUAGES[language]["extension"]
-            source_file = f"{TEMP_DIR}/{uuid.uuid4().hex}{ext}"
-            with open(source_file, "w") as f:
-                f.write(code)
-            sources += source_file + " "
-
-        # Handle attachments
-        used_attachments = []
-        for attachment in attachments:
-            if not linked_files or attachment.filename in linked_files:
-                file_path = os.path.join(TEMP_DIR, attachment.filename)
-                await attachment.save(file_path)
-                sources += file_path + " "
-                used_attachments.append(attachment.filename)
-
-        # Auto-detect language from first file if not specified
-        if not language and used_attachments:
-            ext = os.path.splitext(used_attachments[0])[1]
-            for lang, info in LANGUAGES.items():
-                if ext == info["extension"]:
-                    language = lang
-                    break
+            lang_info = LANGUAGES[language]
+
+            # Reuse a recent result for identical input
+            key = await asyncio.to_thread(sources_digest, language, compiler_flags, sources)
+            cached = cached_output(key)
+            if cached is not None:
+                run_returncode, run_stdout, run_stderr = cached
             else:
-                await interaction.followup.send("Could not auto-detect language")
-                return
+                # Compile if needed (reusing a cached binary for identical input).
+                # The binary runs from a hard link in work_dir, so cache eviction
+                # can't remove it between the lookup and the run.
+                if "compile" in lang_info:
+                    cached_binary = os.path.join(BIN_CACHE, key)
+                    output_name = os.path.join(work_dir, uuid.uuid4().hex)
+                    entry = COMPILE_LOCKS.setdefault(key, [asyncio.Lock(), 0])
+                    entry[1] += 1
+                    try:
+                        async with entry[0]:
+                            try:
+                                os.link(cached_binary, output_name)
+                            except FileNotFoundError:
+                                compile_argv = lang_info["compile"](sources, output_name, compiler_flags)
+                                compile_env = {**os.environ, "TMPDIR": work_dir}
+                                returncode, _, compile_stderr = await run_process(
+                                    compile_argv, env=compile_env, cwd=work_dir
+                                )
 
-        # Validate language
-        if language not in LANGUAGES:
-            await interaction.followup.send(f"Unsupported language: {language}")
-            return
+                                if returncode != 0:
+                                    output = f"**Compilation failed:**\n```{compile_stderr.decode('utf-8', 'replace')}```"
+                                    await interaction.followup.send(output)
+                                    RUN_LOGS.append(f"{language} compile failed")
+                                    return
 
-        lang_info = LANGUAGES[language]
+                                os.link(output_name, cached_binary)
+                                await asyncio.to_thread(evict_binary_cache, keep=cached_binary)
+                    finally:
+                        entry[1] -= 1
+                        if not entry[1]:
+                            del COMPILE_LOCKS[key]
+                else:
+                    output_name = None
 
-        # Compile if needed
-        if "compile" in lang_info:
-            compile_cmd = lang_info["compile"].format(
-                sources=sources.strip(),
-                output=output_name,
-                flags=compiler_flags
-            )
-            compile_result = subprocess.run(
-                compile_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=10
-            )
+                # Execute
+                if language in WARM_POOLS:
+                    run_returncode, run_stdout, run_stderr = await WARM_POOLS[language].run(
+                        sources, CHILD_LIMITS, work_dir
+                    )
+                else:
+                    run_argv = lang_info["run"](output_name, sources)
+                    run_returncode, run_stdout, run_stderr = await run_process(
+                        run_argv, CHILD_LIMITS, cwd=work_dir
+                    )
+                store_output(key, run_returncode, run_stdout, run_stderr)
 
-            if compile_result.returncode != 0:
-                output = f"**Compilation failed:**\n```{compile_result.stderr.decode()}```"
-                await interaction.followup.send(output)
-                RUN_LOGS.append(f"{language} compile failed")
-                return
+            # Format output as raw bytes; only decode if it fits in a message
+            output = bytearray()
+            if run_stdout:
+                output += b"**Output:**\n```"
+                output += run_stdout
+                output += b"```"
+            if run_stderr:
+                if output:
+                    output += b"\n"
+                output += b"**Errors:**\n```"
+                output += run_stderr
+                output += b"```"
+            if run_returncode < 0:
+                if output:
+                    output += b"\n"
+                output += f"**{signal_note(-run_returncode)}**".encode()
 
-            run_cmd = lang_info["run"].format(output=output_name)
-        else:
-            run_cmd = lang_info["run"].format(sources=sources.strip())
-
-        # Execute
-        run_result = subprocess.run(
-            run_cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=10
-        )
+            # Log and respond
+            RUN_LOGS.append(f"{language} run ({len(used_attachments)} files)")
 
-        # Format output
-        output = []
-        if run_result.stdout:
-            output.append(f"**Output:**\n```{run_result.stdout.decode()}```")
-        if run_result.stderr:
-            output.append(f"**Errors:**\n```{run_result.stderr.decode()}```")
-        output_text = "\n".join(output) or "No output"
-
-        # Log and respond
-        RUN_LOGS.append(f"{language} run ({len(used_attachments)} files)")
-        if len(RUN_LOGS) > MAX_LOGS:
-            RUN_LOGS.pop(0)
-
-        if len(output_text) > 1800:
-            with open(f"{TEMP_DIR}/output.txt", "w") as f:
-                f.write(output_text)
-            await interaction.followup.send(
-                content="Output too long:",
-                file=discord.File(f"{TEMP_DIR}/output.txt")
-            )
-        else:
-            await interaction.followup.send(output_text)
-
-    except subprocess.TimeoutExpired:
-        await interaction.followup.send("⏰ Execution timed out")
-    except Exception as e:
-        await interaction.followup.send(f"❌ Error:\n```{traceback.format_exc()}```")
-    finally:
-        # Cleanup
-        for f in os.listdir(TEMP_DIR):
-            try:
-                os.remove(os.path.join(TEMP_DIR, f))
-            except:
-                pass
+            if len(output) > 1800:
+                await interaction.followup.send(
+                    content="Output too long:",
+                    file=discord.File(io.BytesIO(output), filename="output.txt")
+                )
+            else:
+                await interaction.followup.send(output.decode("utf-8", "replace") or "No output")
+
+        except asyncio.TimeoutError:
+            await interaction.followup.send("⏰ Execution timed out")
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error:\n```{traceback.format_exc()}```")
 
 @tree.command(name="eval", description="Run code or files")
 @app_commands.describe(flags="Command flags (see /help)")
@@ -267,9 +712,44 @@ async def eval_command(interaction: discord.Interaction, flags: str):
         await interaction.response.defer(thinking=True)
         await process_eval(interaction, args, [])
 
+# Fingerprint of the last command set pushed to Discord
+SYNC_FINGERPRINT_FILE = ".cmdsync"
+COMMANDS_SYNCED = False
+
+def commands_fingerprint() -> str:
+    data = [
+        [
+            cmd.name,
+            cmd.description,
+            [[p.name, p.description, str(p.type), p.required] for p in cmd.parameters],
+        ]
+        for cmd in sorted(tree.get_commands(), key=lambda c: c.name)
+    ]
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands():
+    """Sync slash commands only when they changed since the last deploy."""
+    global COMMANDS_SYNCED
+    if COMMANDS_SYNCED:
+        return
+    fingerprint = commands_fingerprint()
+    try:
+        with open(SYNC_FINGERPRINT_FILE) as f:
+            up_to_date = f.read().strip() == fingerprint
+    except OSError:
+        up_to_date = False
+    if not up_to_date:
+        await tree.sync()
+        with open(SYNC_FINGERPRINT_FILE, "w") as f:
+            f.write(fingerprint)
+    COMMANDS_SYNCED = True
+
 @client.event
 async def on_ready():
-    await tree.sync()
+    for pool in WARM_POOLS.values():
+        await pool.start()
+    await sync_commands()
     print(f"Ready as {client.user}")
 
-client.run(TOKEN)
+if __name__ == "__main__":
+    client.run(TOKEN)
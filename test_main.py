@@ -0,0 +1,238 @@
+import asyncio
+import os
+import shlex
+import shutil
+import signal
+import time
+from unittest import mock
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(main.TEMP_DIR)
+    os.makedirs(main.BIN_CACHE)
+    main.OUT_CACHE.clear()
+    return tmp_path
+
+
+def make_interaction():
+    interaction = mock.Mock()
+    interaction.followup.send = mock.AsyncMock()
+    return interaction
+
+
+def test_parse_eval_args():
+    ns, rest = main.parse_eval_args(shlex.split('-r main.c -l C -ln a.c b.c -f "-O2 -Wall"'))
+    assert rest == ["main.c"]
+    assert ns.language == "C"
+    assert ns.linked_files == ["a.c", "b.c"]
+    assert ns.flags == "-O2 -Wall"
+
+
+def test_parse_eval_args_dash_prefixed_value():
+    ns, _ = main.parse_eval_args(shlex.split("-r main.c -f -O2"))
+    assert ns.flags == "-O2"
+    ns, _ = main.parse_eval_args(shlex.split("-r -f -lm -l c"))
+    assert ns.flags == "-lm"
+    assert ns.language == "c"
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc not installed")
+def test_inline_code_reuses_cached_binary(workdir):
+    args = ["-r", "-l", "c", "-c", '#include <stdio.h>\nint main(){puts("hi");}']
+    for _ in range(2):
+        main.OUT_CACHE.clear()
+        interaction = make_interaction()
+        asyncio.run(main.process_eval(interaction, args, []))
+        interaction.followup.send.assert_awaited_once_with("**Output:**\n```hi\n```")
+    assert len(os.listdir(main.BIN_CACHE)) == 1
+
+
+def test_identical_inline_runs_hit_output_cache(workdir):
+    args = ["-r", "-l", "bash", "-c", "echo $RANDOM"]
+    replies = []
+    with mock.patch.object(main, "run_process", wraps=main.run_process) as run_process:
+        for _ in range(2):
+            interaction = make_interaction()
+            asyncio.run(main.process_eval(interaction, args, []))
+            replies.append(interaction.followup.send.await_args)
+    assert run_process.call_count == 1
+    assert replies[0] == replies[1]
+    assert len(main.OUT_CACHE) == 1
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc not installed")
+def test_concurrent_identical_compiles_run_compiler_once(workdir):
+    args = ["-r", "-l", "c", "-c", '#include <stdio.h>\nint main(){puts("hi");}']
+    interactions = [make_interaction() for _ in range(3)]
+
+    async def run_all():
+        await asyncio.gather(*[main.process_eval(i, args, []) for i in interactions])
+
+    with mock.patch.object(main, "run_process", wraps=main.run_process) as run_process:
+        asyncio.run(run_all())
+    compiles = [c for c in run_process.call_args_list if "gcc" in c.args[0]]
+    assert len(compiles) == 1
+    for interaction in interactions:
+        interaction.followup.send.assert_awaited_once_with("**Output:**\n```hi\n```")
+    assert main.COMPILE_LOCKS == {}
+
+
+def run_in_pool(tmp_path, scripts, size=1):
+    """Run each script source in a fresh warm Python pool, concurrently."""
+    paths = []
+    for i, source in enumerate(scripts):
+        path = tmp_path / f"job{i}.py"
+        path.write_text(source)
+        paths.append(str(path))
+
+    async def run_all():
+        pool = main.WorkerPool(["python3", "-c", main.PY_ZYGOTE], size=size)
+        await pool.start()
+        try:
+            return await asyncio.gather(*[pool.run([p]) for p in paths])
+        finally:
+            while not pool.idle.empty():
+                await pool.retire(pool.idle.get_nowait())
+
+    return asyncio.run(run_all())
+
+
+def test_warm_pool_matches_interpreter_shutdown(tmp_path):
+    (result,) = run_in_pool(tmp_path, [
+        "import atexit, threading, time\n"
+        "atexit.register(lambda: print('atexit ran'))\n"
+        "threading.Thread(target=lambda: (time.sleep(0.1), print('thread done'))).start()\n"
+        "import sys; sys.exit(3)\n"
+    ])
+    assert result == (3, b"thread done\natexit ran\n", b"")
+
+
+def test_warm_pool_traceback_hides_worker_frames(tmp_path):
+    (result,) = run_in_pool(tmp_path, ["def f():\n    raise ValueError('boom')\nf()\n"])
+    returncode, stdout, stderr = result
+    assert returncode == 1
+    assert stderr.startswith(b"Traceback (most recent call last):\n  File ")
+    assert b"job0.py" in stderr and b"ValueError: boom" in stderr
+    assert b"<string>" not in stderr and b"runpy" not in stderr
+
+
+def test_warm_pool_runs_more_jobs_than_workers(tmp_path):
+    scripts = ["import time; time.sleep(0.5); print('ok')"] * 4
+    results = run_in_pool(tmp_path, scripts, size=1)
+    assert results == [(0, b"ok\n", b"")] * 4
+
+
+def test_run_process_applies_limits():
+    script = "import resource as r; print(r.getrlimit(r.RLIMIT_CPU), r.getrlimit(r.RLIMIT_FSIZE))"
+    returncode, stdout, _ = asyncio.run(main.run_process(["python3", "-c", script], main.CHILD_LIMITS))
+    assert returncode == 0
+    assert stdout == b"(5, 5) (10485760, 10485760)\n"
+
+
+def test_warm_pool_keeps_worker_after_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "EXEC_TIMEOUT", 0.5)
+    path = tmp_path / "sleep.py"
+    path.write_text("import time; time.sleep(30)")
+
+    async def run():
+        pool = main.WorkerPool(["python3", "-c", main.PY_ZYGOTE], size=1)
+        await pool.start()
+        worker = pool.idle._queue[0]
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run([str(path)])
+        assert pool.idle.qsize() == 1 and pool.idle._queue[0] is worker
+        assert worker[0].returncode is None
+        await pool.retire(pool.idle.get_nowait())
+
+    asyncio.run(run())
+
+
+def test_run_process_output_cap_kills_background_children():
+    start = time.monotonic()
+    returncode, stdout, stderr = asyncio.run(main.run_process(
+        ["bash", "-c", "sleep 30 & yes | head -c 5000000; wait"]
+    ))
+    assert time.monotonic() - start < main.EXEC_TIMEOUT / 2
+    assert returncode == -signal.SIGKILL
+    assert stderr.endswith(b"process killed]")
+
+
+def test_run_process_timeout_kills_background_children(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "EXEC_TIMEOUT", 0.5)
+    marker = tmp_path / "survived"
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main.run_process(["bash", "-c", f"(sleep 1; touch {marker}) & sleep 30"]))
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+@pytest.mark.parametrize("language, code", [
+    ("bash", "touch junk; pwd"),
+    ("python", "open('junk', 'w'); import os; print(os.getcwd())"),
+])
+def test_programs_run_in_their_work_dir(workdir, monkeypatch, language, code):
+    async def run():
+        pool = main.WorkerPool(["python3", "-c", main.PY_ZYGOTE], size=1)
+        monkeypatch.setitem(main.WARM_POOLS, "python", pool)
+        interaction = make_interaction()
+        await main.process_eval(interaction, ["-r", "-l", language, "-c", code], [])
+        while not pool.idle.empty():
+            await pool.retire(pool.idle.get_nowait())
+        return interaction.followup.send.await_args.args[0]
+
+    reply = asyncio.run(run())
+    assert f"```{workdir / main.TEMP_DIR}/eval_" in reply
+    assert not (workdir / "junk").exists()
+    assert os.listdir(workdir / main.TEMP_DIR) == []
+
+
+def test_memory_limit_allows_runtimes_that_reserve_address_space(tmp_path):
+    programs = [("python3", ["python3", "-c", "print('hi')"])]
+    if shutil.which("node"):
+        programs.append(("node", ["node", "-e", "console.log('hi')"]))
+    if shutil.which("go"):
+        source = tmp_path / "main.go"
+        source.write_text('package main\nimport "fmt"\nfunc main() { fmt.Println("hi") }\n')
+        binary = str(tmp_path / "main")
+        returncode, _, stderr = asyncio.run(main.run_process(
+            main.LANGUAGES["go"]["compile"]([str(source)], binary, ""), cwd=str(tmp_path)
+        ))
+        assert returncode == 0, stderr
+        programs.append(("go", [binary]))
+    for name, argv in programs:
+        result = asyncio.run(main.run_process(argv, main.CHILD_LIMITS, cwd=str(tmp_path)))
+        assert result == (0, b"hi\n", b""), name
+
+
+def test_memory_limit_stops_large_allocations():
+    returncode, _, stderr = asyncio.run(main.run_process(
+        ["python3", "-c", "x = bytearray(1 << 30)"], main.CHILD_LIMITS
+    ))
+    assert returncode == 1
+    assert b"MemoryError" in stderr
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="gcc not installed")
+def test_cpu_limit_kill_is_reported(workdir):
+    interaction = make_interaction()
+    asyncio.run(main.process_eval(interaction, ["-r", "-l", "c", "-c", "int main(){for(;;);}"], []))
+    interaction.followup.send.assert_awaited_once_with("**Killed by signal 9 (resource limit)**")
+
+
+def test_duplicate_attachment_names_are_rejected(workdir):
+    attachments = []
+    for _ in range(2):
+        attachment = mock.Mock(filename="main.py", size=10)
+        attachment.save = mock.AsyncMock()
+        attachments.append(attachment)
+    interaction = make_interaction()
+    asyncio.run(main.process_eval(interaction, ["-r", "-fl"], attachments))
+    interaction.followup.send.assert_awaited_once_with("Duplicate attachment name: main.py")
+    for attachment in attachments:
+        attachment.save.assert_not_awaited()